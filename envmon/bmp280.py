@@ -1,12 +1,15 @@
-import math
 import struct
 import logging
 from time import sleep
 from enum import IntEnum
 from sensors import Sensor
+from equations import (
+    bytes_to_pressure,
+    temp_compensate,
+    pressure_to_altitude,
+    sea_level_from_altitude,
+)
 try:
-    from typing import Optional
-
     # Used only for type annotations.
     from busio import SPI, I2C
     from digitalio import DigitalInOut
@@ -27,6 +30,9 @@ https://github.com/adafruit/Adafruit_CircuitPython_BMP280
 _CHIP_ID = 0x58
 BMP280_ADDR = 0x77
 
+# DIG_T1..DIG_T3 then DIG_P1..DIG_P9, little endian
+_COEFFICIENTS = struct.Struct("<HhhHhhhhhhhh")
+
 class Register(IntEnum):
     """ BMP280 Register addresses """
 
@@ -67,6 +73,17 @@ class Overscan(IntEnum):
     X16 = 0x05
 
 
+# Number of samples taken for each overscan setting
+_BMP280_OVERSCANS = {
+    Overscan.DISABLE: 0,
+    Overscan.X1: 1,
+    Overscan.X2: 2,
+    Overscan.X4: 4,
+    Overscan.X8: 8,
+    Overscan.X16: 16,
+}
+
+
 class Mode(IntEnum):
     """ mode values """
     SLEEP = 0x00
@@ -89,6 +106,21 @@ class Standby(IntEnum):
     TC_1000 = 0x05  # 1000ms
 
 
+# Writing 0xB6 to the reset register triggers a power-on reset
+_SOFTRESET_CMD = bytes((Register.SOFTRESET, 0xB6))
+
+
+def _to_member(enum_class, value, message: str):
+    """
+    Convert a register value to its enum member, for values set from outside the class
+    raises ValueError with message if it isn't a valid value
+    """
+    try:
+        return enum_class(value)
+    except ValueError:
+        raise ValueError(message % (value,)) from None
+
+
 class BMP280(Sensor):  # pylint: disable=invalid-name
 
     def __init__(self, i2cbus, sensor_data, addr=BMP280_ADDR, **kwargs) -> None:
@@ -99,52 +131,71 @@ class BMP280(Sensor):  # pylint: disable=invalid-name
         self._buffer = bytearray(4)
         chip_id = self._read_byte(Register.CHIPID)
         if _CHIP_ID != chip_id:
-            self.logger.error("Failed to find BMP280! Chip ID 0x%x" % chip_id)
+            self.logger.error("Failed to find BMP280! Chip ID 0x%x", chip_id)
         # Set some reasonable defaults.
         self._iir_filter = IIR_Filter.DISABLE
         self._overscan_temperature = Overscan.X2
         self._overscan_pressure = Overscan.X16
         self._t_standby = Standby.TC_0_5
         self._mode = Mode.SLEEP
+        # Register writes reuse these buffers, byte 1 holds the cached value
+        self._ctrl_meas_buf = bytearray([Register.CTRL_MEAS, 0])
+        self._config_buf = bytearray([Register.CONFIG, 0])
+        self._update_ctrl_meas()
+        self._update_config()
         self.reset()
         self._read_coefficients()
-        self._write_ctrl_meas()
-        self._write_config()
+        self._write_config()  # config is written while still asleep
+        self._write_ctrl_meas()  # oversampling, the mode setter skips it if staying asleep
+        # Normal mode measures continuously, so read() doesn't have to
+        # trigger a measurement and wait for it on every sample
+        self.mode = kwargs.get("mode", Mode.NORMAL)
         self.sea_level_pressure = 1013.25
         """Pressure in hectoPascals at sea level. Used to calibrate `altitude`."""
         self._t_fine = None
 
     def shutdown(self):
-        self._mode = Mode.SLEEP
+        self.mode = Mode.SLEEP
+
+    def _measure(self) -> None:
+        """Perform one measurement unless the sensor is measuring continuously"""
+        if self._mode is not Mode.NORMAL:
+            # Write ctrl_meas every time rather than going through the mode
+            # setter, whose stored mode may already be FORCE
+            self._mode = Mode.FORCE
+            self._update_ctrl_meas()
+            self._write_ctrl_meas()
+            # Conversion time is known, so sleep through most of it
+            # and only poll the status register for the tail
+            sleep(self.measurement_time_typical / 1000.0)
+            while self._get_status() & 0x08:
+                sleep(0.0005)
+            # The device goes back to Sleep once a forced measurement is done
+            self._mode = Mode.SLEEP
 
     def _read_temperature(self) -> None:
         self.logger.debug("Reading Temperature")
-        # perform one measurement
-        if self.mode != Mode.NORMAL:
-            self.mode = Mode.FORCE
-            # Wait for conversion to complete
-            while self._get_status() & 0x08:
-                sleep(0.002)
-
-        raw_temperature = (
-            self._read24(Register.TEMPDATA) / 16
-        )  # lowest 4 bits get dropped
-        var1 = (
-            raw_temperature / 16384.0 - self._temp_calib[0] / 1024.0
-        ) * self._temp_calib[1]
-        var2 = (
-            (raw_temperature / 131072.0 - self._temp_calib[0] / 8192.0)
-            * (raw_temperature / 131072.0 - self._temp_calib[0] / 8192.0)
-        ) * self._temp_calib[2]
-
-        self._t_fine = int(var1 + var2)
-
+        self._measure()
+        raw_temperature = self._read24(Register.TEMPDATA) >> 4  # lowest 4 bits get dropped
+        self._t_fine = temp_compensate(raw_temperature, self._temp_calib)
+
+    def _read_pressure(self) -> float:
+        """Measure and return the pressure, updating t_fine from the same measurement"""
+        self._measure()
+        # Pressure and temperature registers are contiguous, so read both
+        # in one burst, which also keeps them from the same measurement
+        raw = int.from_bytes(self._read_register(Register.PRESSUREDATA, 6), "big")
+        adc_p = raw >> 28  # top 20 of the 3 pressure bytes
+        adc_t = (raw >> 4) & 0xFFFFF  # top 20 of the 3 temperature bytes
+        self._t_fine = temp_compensate(adc_t, self._temp_calib)
+        return bytes_to_pressure(adc_p, self._t_fine, self._pressure_calib)
 
     def reset(self) -> None:
         """Soft reset the sensor"""
         self.logger.debug("Resetting")
-        self._send_cmd(bytearray([Register.SOFTRESET, 0xB6]))
-        sleep(0.004)  # Datasheet says 2ms.  Using 4ms just to be safe
+        # Datasheet says 2ms.  Using 4ms just to be safe
+        # Rather than blocking here, the next register access waits out the remainder
+        self._send_cmd(_SOFTRESET_CMD, delay_ms=4, defer=True)
 
     def _write_ctrl_meas(self) -> None:
         """
@@ -152,7 +203,7 @@ class BMP280(Sensor):  # pylint: disable=invalid-name
         ctrl_meas sets the pressure and temperature data acquisition options
         """
         self.logger.debug("Setting ctrl_meas registers")
-        self._send_cmd(bytearray([Register.CTRL_MEAS, self._ctrl_meas]))
+        self._send_cmd(self._ctrl_meas_buf)
 
     def _get_status(self) -> int:
         """Get the value from the status register in the device"""
@@ -170,7 +221,7 @@ class BMP280(Sensor):  # pylint: disable=invalid-name
             normal_flag = True
             self.mode = Mode.SLEEP  # So we switch to Sleep mode first
         self.logger.debug("Setting config registers")
-        self._send_cmd(bytearray([Register.CONFIG, self._config]))
+        self._send_cmd(self._config_buf)
         if normal_flag:
             self.mode = Mode.NORMAL
 
@@ -184,9 +235,12 @@ class BMP280(Sensor):  # pylint: disable=invalid-name
 
     @mode.setter
     def mode(self, value: int) -> None:
-        if value not in Mode:
-            raise ValueError("Mode '%s' not supported" % (value))
+        if type(value) is not Mode:
+            value = _to_member(Mode, value, "Mode '%s' not supported")
+        if self._mode == value:
+            return
         self._mode = value
+        self._update_ctrl_meas()
         self._write_ctrl_meas()
 
     @property
@@ -199,11 +253,12 @@ class BMP280(Sensor):  # pylint: disable=invalid-name
 
     @standby_period.setter
     def standby_period(self, value: int) -> None:
-        if value not in Standby:
-            raise ValueError("Standby Period '%s' not supported" % (value))
+        if type(value) is not Standby:
+            value = _to_member(Standby, value, "Standby Period '%s' not supported")
         if self._t_standby == value:
             return
         self._t_standby = value
+        self._update_config()
         self._write_config()
 
     @property
@@ -216,9 +271,10 @@ class BMP280(Sensor):  # pylint: disable=invalid-name
 
     @overscan_temperature.setter
     def overscan_temperature(self, value: int) -> None:
-        if value not in Overscan:
-            raise ValueError("Overscan value '%s' not supported" % (value))
+        if type(value) is not Overscan:
+            value = _to_member(Overscan, value, "Overscan value '%s' not supported")
         self._overscan_temperature = value
+        self._update_ctrl_meas()
         self._write_ctrl_meas()
 
     @property
@@ -231,9 +287,10 @@ class BMP280(Sensor):  # pylint: disable=invalid-name
 
     @overscan_pressure.setter
     def overscan_pressure(self, value: int) -> None:
-        if value not in Overscan:
-            raise ValueError("Overscan value '%s' not supported" % (value))
+        if type(value) is not Overscan:
+            value = _to_member(Overscan, value, "Overscan value '%s' not supported")
         self._overscan_pressure = value
+        self._update_ctrl_meas()
         self._write_ctrl_meas()
 
     @property
@@ -246,129 +303,98 @@ class BMP280(Sensor):  # pylint: disable=invalid-name
 
     @iir_filter.setter
     def iir_filter(self, value: int) -> None:
-        if value not in IIR_Filter:
-            raise ValueError("IIR Filter '%s' not supported" % (value))
+        if type(value) is not IIR_Filter:
+            value = _to_member(IIR_Filter, value, "IIR Filter '%s' not supported")
         self._iir_filter = value
+        self._update_config()
         self._write_config()
 
-    @property
-    def _config(self) -> int:
-        """Value to be written to the device's config register"""
-        config = 0
-        if self.mode == Mode.NORMAL:
-            config += self._t_standby << 5
-        if self._iir_filter:
-            config += self._iir_filter << 2
-        return config
+    def _update_config(self) -> None:
+        """
+        Recompute the value to be written to the device's config register
+        The standby period is only used by the device in Normal mode
+        """
+        self._config_buf[1] = (self._t_standby << 5) | (self._iir_filter << 2)
 
-    @property
-    def _ctrl_meas(self) -> int:
-        """Value to be written to the device's ctrl_meas register"""
-        ctrl_meas = self.overscan_temperature << 5
-        ctrl_meas += self.overscan_pressure << 2
-        ctrl_meas += self.mode
-        return ctrl_meas
+    def _update_ctrl_meas(self) -> None:
+        """Recompute the value to be written to the device's ctrl_meas register"""
+        self._ctrl_meas_buf[1] = (
+            (self._overscan_temperature << 5)
+            | (self._overscan_pressure << 2)
+            | self._mode
+        )
 
     @property
     def measurement_time_typical(self) -> float:
         """Typical time in milliseconds required to complete a measurement in normal mode"""
         meas_time_ms = 1
-        if self.overscan_temperature != Overscan.DISABLE:
-            meas_time_ms += 2 * _BMP280_OVERSCANS.get(self.overscan_temperature)
-        if self.overscan_pressure != Overscan.DISABLE:
-            meas_time_ms += 2 * _BMP280_OVERSCANS.get(self.overscan_pressure) + 0.5
+        if self._overscan_temperature != Overscan.DISABLE:
+            meas_time_ms += 2 * _BMP280_OVERSCANS.get(self._overscan_temperature)
+        if self._overscan_pressure != Overscan.DISABLE:
+            meas_time_ms += 2 * _BMP280_OVERSCANS.get(self._overscan_pressure) + 0.5
         return meas_time_ms
 
     @property
     def measurement_time_max(self) -> float:
         """Maximum time in milliseconds required to complete a measurement in normal mode"""
         meas_time_ms = 1.25
-        if self.overscan_temperature != Overscan.DISABLE:
-            meas_time_ms += 2.3 * _BMP280_OVERSCANS.get(self.overscan_temperature)
-        if self.overscan_pressure != Overscan.DISABLE:
-            meas_time_ms += 2.3 * _BMP280_OVERSCANS.get(self.overscan_pressure) + 0.575
+        if self._overscan_temperature != Overscan.DISABLE:
+            meas_time_ms += 2.3 * _BMP280_OVERSCANS.get(self._overscan_temperature)
+        if self._overscan_pressure != Overscan.DISABLE:
+            meas_time_ms += 2.3 * _BMP280_OVERSCANS.get(self._overscan_pressure) + 0.575
         return meas_time_ms
 
-    def read(self) -> float:
+    def read(self) -> None:
         ''' Intended to run from Event callback
         updates global sensordata object '''
-        self._read_temperature()
-        temperature_c = self._t_fine / 5120.0
-        pressure_hpa = self.pressure
-        self._sensor_data.temp_c = temperature_c
-        self._sensor_data.pressure_hpa = pressure_hpa
+        self.logger.debug("Reading Pressure and Temperature")
+        pressure = self._read_pressure()
+        self._sensor_data.temp_c = self._t_fine / 5120.0
+        self._sensor_data.pressure_hpa = pressure
 
     @property
     def temperature(self) -> float:
-        """The compensated temperature in degrees Celsius."""
+        """
+        The compensated temperature in degrees Celsius.
+        Reads over I2C on every access, outside Normal mode each access also
+        triggers a forced measurement and sleeps until it completes,
+        use `read` for regular sampling
+        """
         self._read_temperature()
         return self._t_fine / 5120.0
 
     @property
-    def pressure(self) -> Optional[float]:
+    def pressure(self) -> float:
         """
         The compensated pressure in hectoPascals.
-        returns `None` if pressure measurement is disabled
+        Reads over I2C on every access, outside Normal mode each access also
+        triggers a forced measurement and sleeps until it completes,
+        use `read` for regular sampling
         """
-
-        # Algorithm from the BMP280 driver
-        # https://github.com/BoschSensortec/BMP280_driver/blob/master/bmp280.c
-        adc = self._read24(Register.PRESSUREDATA) / 16  # lowest 4 bits get dropped
-        var1 = float(self._t_fine) / 2.0 - 64000.0
-        var2 = var1 * var1 * self._pressure_calib[5] / 32768.0
-        var2 = var2 + var1 * self._pressure_calib[4] * 2.0
-        var2 = var2 / 4.0 + self._pressure_calib[3] * 65536.0
-        var3 = self._pressure_calib[2] * var1 * var1 / 524288.0
-        var1 = (var3 + self._pressure_calib[1] * var1) / 524288.0
-        var1 = (1.0 + var1 / 32768.0) * self._pressure_calib[0]
-        if not var1:  # avoid exception caused by division by zero
-            raise ArithmeticError(
-                "Invalid result possibly related to error while reading the calibration registers"
-            )
-        pressure = 1048576.0 - adc
-        pressure = ((pressure - var2 / 4096.0) * 6250.0) / var1
-        var1 = self._pressure_calib[8] * pressure * pressure / 2147483648.0
-        var2 = pressure * self._pressure_calib[7] / 32768.0
-        pressure = pressure + (var1 + var2 + self._pressure_calib[6]) / 16.0
-        pressure /= 100
-
-        return pressure
+        return self._read_pressure()
 
     @property
     def altitude(self) -> float:
         """The altitude based on the sea level pressure (:attr:`sea_level_pressure`)
         - which you must enter ahead of time)"""
-        p = self.pressure  # in Si units for hPascal
-        return 44330 * (1.0 - math.pow(p / self.sea_level_pressure, 0.1903))
+        return pressure_to_altitude(self.pressure, self.sea_level_pressure)
 
     @altitude.setter
     def altitude(self, value: float) -> None:
-        p = self.pressure  # in Si units for hPascal
-        self.sea_level_pressure = p / math.pow(1.0 - value / 44330.0, 5.255)
+        self.sea_level_pressure = sea_level_from_altitude(self.pressure, value)
 
     ####################### Internal helpers ################################
 
-    def _read24(self, register):
-        ret = 0.0
-        for b in self._read_register(register, 3):
-            ret *= 256
-            ret += float(b & 0xFF)
-        return ret
+    def _read24(self, register) -> int:
+        """Read a 24 bit big endian register"""
+        return int.from_bytes(self._read_register(register, 3), "big")
 
     def _read_coefficients(self) -> None:
         """Read & save the calibration coefficients"""
-        coeff = self._read_register(Register.DIG_T1, 24)
-        coeff = list(struct.unpack("<HhhHhhhhhhhh", bytes(coeff)))
-        coeff = [float(i) for i in coeff]
         self.logger.debug("Reading calibration coefficients")
+        coeff = _COEFFICIENTS.unpack_from(self._read_register(Register.DIG_T1, _COEFFICIENTS.size))
         self.logger.debug(coeff)
         # The temp_calib lines up with DIG_T# registers.
-        self._temp_calib = coeff[:3]
-        self._pressure_calib = coeff[3:]
-        # print("%d %d %d" % (self._temp_calib[0], self._temp_calib[1], self._temp_calib[2]))
-        # print("%d %d %d" % (self._pressure_calib[0], self._pressure_calib[1],
-        #                     self._pressure_calib[2]))
-        # print("%d %d %d" % (self._pressure_calib[3], self._pressure_calib[4],
-        #                     self._pressure_calib[5]))
-        # print("%d %d %d" % (self._pressure_calib[6], self._pressure_calib[7],
-        #                     self._pressure_calib[8]))
+        # Stored as floats so the compensation math never mixes int and float
+        self._temp_calib = tuple(float(c) for c in coeff[:3])
+        self._pressure_calib = tuple(float(c) for c in coeff[3:])
@@ -0,0 +1,71 @@
+import math
+
+try:
+    from typing import Sequence
+except ImportError:
+    pass
+
+"""
+BMP280 compensation equations
+Floating point versions of the algorithms in the Bosch BMP280 driver
+
+https://github.com/BoschSensortec/BMP280_driver/blob/master/bmp280.c
+
+These are kept free of sensor state so they can be called with plain
+numbers, calibration coefficients are passed in as a sequence
+"""
+
+
+def bytes_to_pressure(adc: int, t_fine: int, calib: Sequence[float]) -> float:
+    """
+    Compensated pressure in hectoPascals
+    adc is the raw 20 bit pressure reading, calib holds the DIG_P1..DIG_P9 coefficients
+    Integer inputs are converted to float once, by the first operation that uses them
+    """
+    p1, p2, p3, p4, p5, p6, p7, p8, p9 = calib
+    var1 = t_fine / 2.0 - 64000.0
+    var2 = var1 * var1 * p6 / 32768.0
+    var2 = var2 + var1 * p5 * 2.0
+    var2 = var2 / 4.0 + p4 * 65536.0
+    var3 = p3 * var1 * var1 / 524288.0
+    var1 = (var3 + p2 * var1) / 524288.0
+    var1 = (1.0 + var1 / 32768.0) * p1
+    if not var1:  # avoid exception caused by division by zero
+        raise ArithmeticError(
+            "Invalid result possibly related to error while reading the calibration registers"
+        )
+    pressure = 1048576.0 - adc
+    pressure = ((pressure - var2 / 4096.0) * 6250.0) / var1
+    var1 = p9 * pressure * pressure / 2147483648.0
+    var2 = pressure * p8 / 32768.0
+    pressure = pressure + (var1 + var2 + p7) / 16.0
+    return pressure / 100
+
+
+def temp_compensate(raw: int, calib: Sequence[float]) -> int:
+    """
+    Fine resolution temperature value (t_fine)
+    raw is the raw 20 bit temperature reading, calib holds the DIG_T1..DIG_T3 coefficients
+    Divide by 5120 for degrees Celsius, pressure compensation needs it as is
+    """
+    t1, t2, t3 = calib
+    var1 = (raw / 16384.0 - t1 / 1024.0) * t2
+    var2 = raw / 131072.0 - t1 / 8192.0
+    var2 = var2 * var2 * t3
+    return int(var1 + var2)
+
+
+def pressure_to_altitude(pressure: float, sea_level_pressure: float) -> float:
+    """
+    Altitude in meters from the barometric formula
+    Both pressures are in hectoPascals
+    """
+    return 44330.0 * (1.0 - math.pow(pressure / sea_level_pressure, 0.1903))
+
+
+def sea_level_from_altitude(pressure: float, altitude: float) -> float:
+    """
+    Sea level pressure in hectoPascals for a pressure measured at a known altitude
+    This is the inverse of pressure_to_altitude
+    """
+    return pressure / math.pow(1.0 - altitude / 44330.0, 5.255)
@@ -3,6 +3,8 @@ import argparse
 import time
 import sys
 import dataclasses
+import operator
+import threading
 
 from sensors import SensorData
 from scd40 import SCD40
@@ -16,7 +18,7 @@ from busio import I2C
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 import matplotlib as mpl
-import datetime as dt
+import numpy as np
 
 """
 Sensor Data Plotter
@@ -53,8 +55,59 @@ fig, axs = plt.subplots(
 fig.canvas.manager.full_screen_toggle()
 colors = ['red', 'orange', 'cyan', 'blue', 'green', 'purple', 'brown']
 
-xs = []
-y_data = []
+# Number of samples shown on the plot
+x_limit = 20
+
+# Time between plot frames in milliseconds, one sample is taken per frame
+frame_interval = 1000
+
+# SensorData field names, and a getter for each so a frame can
+# read them without astuple copying the dataclass
+FIELDS = tuple(f.name for f in dataclasses.fields(SensorData))
+GETTERS = tuple(operator.attrgetter(name) for name in FIELDS)
+
+# Sliding window of samples, y_data is used as a ring buffer with
+# one row per sample and one column per SensorData field
+y_data = np.full((x_limit, len(FIELDS)), np.nan)
+
+
+class SensorThread(threading.Thread):
+    """
+    Runs the sensor timer in the background
+    so a slow I2C read doesn't freeze the plot
+    The sensors write to data on this thread only, the plot reads
+    snapshots of it which are published after each timer check
+    """
+    def __init__(self, timer: Timer, data: SensorData, period: float = 0.01):
+        super().__init__(daemon=True)
+        self._timer = timer
+        self._data = data
+        self._lock = threading.Lock()  # only held while publishing a snapshot
+        self._snapshot = tuple(get(data) for get in GETTERS)
+        self._period = period  # time between timer checks
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self._timer.run()
+            except Exception:
+                # Keep polling, a failed read shouldn't stop the other sensors
+                logging.exception("Sensor read failed")
+            snapshot = tuple(get(self._data) for get in GETTERS)
+            with self._lock:
+                self._snapshot = snapshot
+            self._stop_event.wait(self._period)
+
+    def snapshot(self) -> tuple:
+        """ The latest SensorData values, in FIELDS order """
+        with self._lock:
+            return self._snapshot
+
+    def stop(self) -> None:
+        """ Stop polling and wait for the current read to finish """
+        self._stop_event.set()
+        self.join()
 
 
 def main():
@@ -62,13 +115,14 @@ def main():
     logging.basicConfig(level=args.loglevel)
 
     # This is a dataclass whose fields are updated by the sensors 
-    # when their "read" method is called
+    # when their "read" method is called, on the sensor thread
     data = SensorData()
 
     i2c = I2C(board.SCL, board.SDA, frequency=100000)
+    # The SCD40 is set up first, the others start up while it stops measuring
+    scd40 = SCD40(i2c, data)
     aqi = AQISensor(i2c, data)
     bmp280 = BMP280(i2c, data)
-    scd40 = SCD40(i2c, data)
 
     my_sensors = [aqi, bmp280, scd40]
     time.sleep(0.1)
@@ -84,12 +138,16 @@ def main():
     for sensor in my_sensors:
         timer.add_event(sensor.read, sensor.read_interval)
 
+    # Sensors are read on their own thread, the plot only takes snapshots
+    sensor_thread = SensorThread(timer, data)
+    sensor_thread.start()
+
     # This function is called when the user left clicks (or touches touchscreen)
     def on_click(event):
-        plt.close(fig)
         logging.debug("Click detected, shutting down")
         print("Shutting down")
         plt.close(fig)
+        sensor_thread.stop()
         for s in my_sensors:
             s.shutdown()
         sys.exit(0)
@@ -97,34 +155,53 @@ def main():
     # Register the shutdown function with the click event
     plt.connect("button_press_event", on_click)
 
+    # Set up the axes once, each frame only updates the line data
+    # With blitting the axes aren't redrawn, so the x axis shows
+    # seconds before the newest sample and the clock is drawn as text
+    x = range(x_limit)
+    lines = [ax.plot(x, np.full(x_limit, np.nan), lw=3, color=c)[0]
+             for ax, c in zip(axs, colors)]
+    for key, ax in zip(FIELDS, axs):
+        ax.set_ylabel(key.upper(), labelpad=10.0, rotation="horizontal")
+        ax.set_xlim(0, x_limit - 1)
+        ax.tick_params(axis='x', labelrotation=45)
+        ax.tick_params(axis='y', labelleft=False,
+                       labelright=True, left=False, right=True)
+    ticks = range(x_limit - 1, -1, -5)
+    axs[-1].set_xticks(
+        ticks=ticks,
+        labels=["%gs" % ((t - x_limit + 1) * frame_interval / 1000) for t in ticks]
+    )
+    clock = axs[0].text(0.01, 0.95, "", transform=axs[0].transAxes, va="top")
+
+    fig.suptitle("Sensor Data")
+
     # The animation loop for the plot window
-    def animate(i, xs, y_data):
-        timer.run()
-
-        xs.append(dt.datetime.now().strftime('%H:%M:%S'))
-        sensor_data_dict = dataclasses.asdict(data)
-        y_data.append(sensor_data_dict)
-
-        x_limit = 20
-
-        xs = xs[-x_limit:]
-        y_data = y_data[-x_limit:]
-        for ax in axs:
-            ax.clear()
-        for key, ax, c in zip(list(sensor_data_dict), axs, colors):
-            ys = [y[key] for y in y_data]
-            ax.plot(xs, ys, lw=3, color=c)
-            ax.set_ylabel(key.upper(), labelpad=10.0, rotation="horizontal")
-            ax.set_xlim(0, 20)
-            ax.set_xticks(ticks=xs)
-            ax.tick_params(axis='x', labelrotation=45)
-            ax.tick_params(axis='y', labelleft=False,
-                           labelright=True, left=False, right=True)
-
-        fig.suptitle("Sensor Data")
-
-    ani = animation.FuncAnimation(fig, animate, fargs=(
-        xs, y_data), interval=1000, cache_frame_data=False)
+    def animate(i, y_data):
+        newest = y_data[i % x_limit]
+        newest[:] = sensor_thread.snapshot()
+        clock.set_text(time.strftime('%H:%M:%S'))
+
+        # Unroll the ring buffer so the oldest sample comes first
+        window = np.roll(y_data, -(i + 1), axis=0)
+        for line, column in zip(lines, window.T):
+            line.set_ydata(column)
+
+        # Blitting only redraws the lines, so new y limits need a full redraw
+        # Rescale when a sample falls outside the limits, and every
+        # x_limit frames to tighten them once old peaks scroll off
+        low, high = np.array([ax.get_ylim() for ax in axs]).T
+        if i % x_limit == 0 or np.any((newest < low) | (newest > high)):
+            for ax in axs:
+                ax.relim()
+                ax.autoscale_view(scalex=False)
+            fig.canvas.draw()
+
+        return (*lines, clock)
+
+    ani = animation.FuncAnimation(fig, animate, fargs=(y_data,),
+                                  interval=frame_interval, blit=True,
+                                  cache_frame_data=False)
 
     while 1:
         plt.show()
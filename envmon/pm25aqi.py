@@ -3,6 +3,13 @@ import struct
 from sensors import Sensor
 
 AQI_ADDR = 0x12
+
+# Frame size, 12 data words, a reserved word and checksum, big endian
+# The 2 byte header is skipped, read() checks it byte by byte
+_FRAME = struct.Struct(">2xH12H2xH")
+
+# Frame size field, the length of the frame after the header and size
+_FRAME_SIZE = _FRAME.size - 4
 """
 Sensor class for PM2.5 AQI sensor using i2c
 
@@ -15,7 +22,8 @@ class AQISensor(Sensor):
         self.logger = logging.getLogger("envmon.AQI")
         self.logger.debug("Init AQI Sensor")
         super().__init__(i2cbus, addr, sensor_data)
-        self._buffer = bytearray(32)
+        self._buffer = bytearray(_FRAME.size)
+        self._checked = memoryview(self._buffer)[:-2]  # the bytes covered by the checksum
 
     def __repr__(self) -> str:
         return "PM2.5 AQI Sensor"
@@ -25,27 +33,20 @@ class AQISensor(Sensor):
         pass
 
     def read(self) -> dict:
-        self._read_raw(length=32)
-        header = self._buffer[0:2]
-        if not header == b"BM":
-            self.logger.error("Invalid header: {}".format(header))
+        self._read_raw()
+        frame_size, *results, checksum = _FRAME.unpack_from(self._buffer)
+        if self._buffer[0] != 0x42 or self._buffer[1] != 0x4D:  # "BM"
+            self.logger.error("Invalid header: %s", self._buffer[0:2])
 
-        frame_size = struct.unpack(">H", self._buffer[2:4])[0]
-        if frame_size != 28:
-            self.logger.error("Invalid Frame Size: {}".format(frame_size))
+        if frame_size != _FRAME_SIZE:
+            self.logger.error("Invalid Frame Size: %s", frame_size)
 
-        checksum = struct.unpack(">H", self._buffer[30:32])[0]
-        check = sum(self._buffer[0:30])
+        check = sum(self._checked)
         if check != checksum:
             self.logger.error("Invalid checksum")
+            return  # keep the last good readings
 
-        try:
-            results = struct.unpack(">HHHHHHHHHHHH", self._buffer[4:28])
-            self.logger.debug(results)
-            self._sensor_data.pm10 = results[0]
-            self._sensor_data.pm25 = results[1]
-            self._sensor_data.pm100 = results[2]
-        except struct.error:
-            buffer_str = str(self._buffer)
-            self.logger.error("failed to unpack buffer")
-            self.logger.error("Buffer: {}".format(buffer_str))
+        self.logger.debug(results)
+        self._sensor_data.pm10 = results[0]
+        self._sensor_data.pm25 = results[1]
+        self._sensor_data.pm100 = results[2]
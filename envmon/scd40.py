@@ -1,9 +1,8 @@
 import time
 import struct
 import logging
-from sensors import Sensor, SensorData
+from sensors import Sensor, SensorData, _WORD
 from enum import IntEnum
-from adafruit_bus_device import i2c_device
 
 try:
     from typing import Tuple, Union
@@ -19,6 +18,12 @@ https://github.com/adafruit/Adafruit_CircuitPython_SCD4X
 
 SCD4X_DEFAULT_ADDR = 0x62
 
+# Command word followed by its argument word, the argument's CRC goes after
+_COMMAND_VALUE = struct.Struct(">HH")
+
+# CO2, temperature and humidity words of a measurement, skipping their CRC bytes
+_MEASUREMENT = struct.Struct(">HxHxHx")
+
 
 class Cmd(IntEnum):
     REINIT = 0x3646
@@ -46,6 +51,11 @@ class Cmd(IntEnum):
         return 2
 
 
+# Commands sent on every sample, packed once rather than on every send
+_DATAREADY_CMD = _WORD.pack(Cmd.DATAREADY)
+_READMEASUREMENT_CMD = _WORD.pack(Cmd.READMEASUREMENT)
+
+
 class SCD40(Sensor):
     """
     CircuitPython helper class for using the SCD4X CO2 sensor
@@ -60,22 +70,25 @@ class SCD40(Sensor):
         super().__init__(i2c_bus, addr, sensor_data)
         self._interval = 6.0
         self._buffer = bytearray(18)
-        self._cmd = bytearray(2)
-        self._crc_buffer = bytearray(2)
 
         # cached readings
         self._temperature = None
         self._relative_humidity = None
         self._co2 = None
+        # data_ready is polled at most once per max age when reading the properties
+        self._ready_max_age = 1.0
+        self._next_poll_at = 0.0
+        self._measurement_period = 5.0  # seconds between periodic measurements
 
-        self.stop_periodic_measurement()
+        # Measurement may still be running from a previous session. The stop
+        # takes 500ms, which other sensors can use to start up meanwhile
+        self._send_cmd(Cmd.STOPPERIODICMEASUREMENT, delay_ms=500, defer=True)
 
     def shutdown(self):
         self.stop_periodic_measurement()
 
     def read(self):
-        if self.data_ready:
-            self._read_data()
+        self._update()
         self._sensor_data.co2 = self._co2
         self._sensor_data.humidity = self._relative_humidity
 
@@ -87,8 +100,7 @@ class SCD40(Sensor):
             Between measurements, the most recent reading will be cached and returned.
 
         """
-        if self.data_ready:
-            self._read_data()
+        self._update()
         return self._co2
 
     @property
@@ -99,8 +111,7 @@ class SCD40(Sensor):
             Between measurements, the most recent reading will be cached and returned.
 
         """
-        if self.data_ready:
-            self._read_data()
+        self._update()
         return self._temperature
 
     @property
@@ -111,8 +122,7 @@ class SCD40(Sensor):
             Between measurements, the most recent reading will be cached and returned.
 
         """
-        if self.data_ready:
-            self._read_data()
+        self._update()
         return self._relative_humidity
 
     def reinit(self) -> None:
@@ -131,8 +141,9 @@ class SCD40(Sensor):
         self.stop_periodic_measurement()
         self._set_command_value(Cmd.FORCEDRECAL, target_co2)
         time.sleep(0.5)
-        self._read_reply(self._buffer, 3)
-        correction = struct.unpack_from(">h", self._buffer[0:2])[0]
+        if self._read_raw(length=3):
+            self._check_buffer_crc(memoryview(self._buffer)[:3])
+        correction = _WORD.unpack_from(self._buffer)[0]
         if correction == 0xFFFF:
             raise RuntimeError(
                 "Forced recalibration failed.\
@@ -150,7 +161,8 @@ class SCD40(Sensor):
             saved with persist_settings().
 
         """
-        self._read_reply(delay=1, length=3, cmd=Cmd.GETASCE)
+        if self._read_reply(delay_ms=1, length=3, cmd=Cmd.GETASCE):
+            self._check_buffer_crc(memoryview(self._buffer)[:3])
         return self._buffer[1] == 1
 
     @self_calibration_enabled.setter
@@ -160,36 +172,54 @@ class SCD40(Sensor):
     def self_test(self) -> None:
         """Performs a self test, takes up to 10 seconds"""
         self.stop_periodic_measurement()
-        self._read_reply(delay_ms=10, length=3, cmd=Cmd.SELFTEST)
+        if self._read_reply(delay_ms=10000, length=3, cmd=Cmd.SELFTEST):
+            self._check_buffer_crc(memoryview(self._buffer)[:3])
         if (self._buffer[0] != 0) or (self._buffer[1] != 0):
             raise RuntimeError("Self test failed")
 
+    def _update(self) -> None:
+        """
+        Read new data if the sensor has some
+        data_ready isn't polled again until new data could be available
+        """
+        now = time.monotonic()
+        if now < self._next_poll_at:
+            return
+        self._next_poll_at = now + self._ready_max_age
+        if self.data_ready:
+            self._read_data()
+            # The sensor has no data ready pin, but measurements come once per
+            # period, so skip polling until shortly before the next one is due
+            self._next_poll_at = now + self._measurement_period - self._ready_max_age
+
     def _read_data(self) -> None:
         """Reads the temp/hum/co2 from the sensor and caches it"""
         self.logger.debug("Reading data")
-        self._read_reply(delay_ms=1, length=9, cmd=Cmd.READMEASUREMENT)
-        self._co2 = (self._buffer[0] << 8) | self._buffer[1]
-        temp = (self._buffer[3] << 8) | self._buffer[4]
-        self._temperature = -45 + 175 * (temp / 2**16)
-        humi = (self._buffer[6] << 8) | self._buffer[7]
-        self._relative_humidity = 100 * (humi / 2**16)
-        self.logger.debug("Temp: {}".format(temp))
-        self.logger.debug("Hum: {}".format(humi))
-        self.logger.debug("co2: {}".format(self._co2))
+        if not self._read_reply(delay_ms=1, length=9, cmd=_READMEASUREMENT_CMD):
+            return  # keep the last values until the sensor answers again
+        self._check_buffer_crc(memoryview(self._buffer)[:9])
+        self._co2, temp, humi = _MEASUREMENT.unpack_from(self._buffer)
+        self._temperature = -45 + temp * (175 / 2**16)
+        self._relative_humidity = humi * (100 / 2**16)
+        self.logger.debug("Temp: %s", temp)
+        self.logger.debug("Hum: %s", humi)
+        self.logger.debug("co2: %s", self._co2)
 
     @property
     def data_ready(self) -> bool:
         """Check the sensor to see if new data is available"""
-        self._read_reply(delay_ms=1, length=3, cmd=Cmd.DATAREADY)
+        if not self._read_reply(delay_ms=1, length=3, cmd=_DATAREADY_CMD):
+            return False
+        self._check_buffer_crc(memoryview(self._buffer)[:3])
         ready = not ((self._buffer[0] & 0x07 == 0) and (self._buffer[1] == 0))
-        self.logger.debug("Data ready: {}".format(ready))
+        self.logger.debug("Data ready: %s", ready)
         return ready
 
     @property
     def serial_number(self) -> Tuple[int, int, int, int, int, int]:
         """Request a 6-tuple containing the unique serial number for this sensor"""
-        self._send_cmd(Cmd.SERIALNUMBER, delay_ms=1)
-        self._read_reply(self._buffer, 9)
+        if self._read_reply(delay_ms=1, length=9, cmd=Cmd.SERIALNUMBER):
+            self._check_buffer_crc(memoryview(self._buffer)[:9])
         return (
             self._buffer[0],
             self._buffer[1],
@@ -220,6 +250,7 @@ class SCD40(Sensor):
             * :meth:`set_ambient_pressure() <adafruit_scd4x.SCD4X.set_ambient_pressure>`
 
         """
+        self._measurement_period = 5.0
         self._send_cmd(Cmd.STARTPERIODICMEASUREMENT)
 
     def start_low_periodic_measurement(self) -> None:
@@ -227,6 +258,7 @@ class SCD40(Sensor):
         :meth:`start_periodic_measurement() <adafruit_scd4x.SCD4X.start_perodic_measurement>`
         for more details.
         """
+        self._measurement_period = 30.0
         self._send_cmd(Cmd.STARTLOWPOWERPERIODICMEASUREMENT)
 
     def persist_settings(self) -> None:
@@ -250,9 +282,9 @@ class SCD40(Sensor):
             persist_settings().
 
         """
-        self._send_cmd(Cmd.GETTEMPOFFSET, delay_ms=0.001)
-        self._read_reply(self._buffer, 3)
-        temp = (self._buffer[0] << 8) | self._buffer[1]
+        if self._read_reply(delay_ms=1, length=3, cmd=Cmd.GETTEMPOFFSET):
+            self._check_buffer_crc(memoryview(self._buffer)[:3])
+        temp = _WORD.unpack_from(self._buffer)[0]
         return 175.0 * temp / 2**16
 
     @temperature_offset.setter
@@ -274,8 +306,9 @@ class SCD40(Sensor):
             This value will NOT be saved and will be reset on boot unless saved with
             persist_settings().
         """
-        self._buffer = self._read_reply(delay_ms=1, length=3, raw=True, cmd=Cmd.GETALTITUDE)
-        return (self._buffer[0] << 8) | self._buffer[1]
+        if self._read_reply(delay_ms=1, length=3, cmd=Cmd.GETALTITUDE):
+            self._check_buffer_crc(memoryview(self._buffer)[:3])
+        return _WORD.unpack_from(self._buffer)[0]
 
     @altitude.setter
     def altitude(self, height: int) -> None:
@@ -284,36 +317,17 @@ class SCD40(Sensor):
         self._set_command_value(Cmd.SETALTITUDE, height)
 
     def _check_buffer_crc(self, buf: bytearray) -> bool:
+        crc8_word = self._crc8_word
         for i in range(0, len(buf), 3):
-            self._crc_buffer[0] = buf[i]
-            self._crc_buffer[1] = buf[i + 1]
-            if self._crc8(self._crc_buffer) != buf[i + 2]:
+            if crc8_word(buf[i], buf[i + 1]) != buf[i + 2]:
                 raise RuntimeError("CRC check failed while reading data")
         return True
 
     def _set_command_value(self, cmd, value, delay_ms=0):
-        self._buffer[0] = (cmd >> 8) & 0xFF
-        self._buffer[1] = cmd & 0xFF
-        self._crc_buffer[0] = self._buffer[2] = (value >> 8) & 0xFF
-        self._crc_buffer[1] = self._buffer[3] = value & 0xFF
-        self._buffer[4] = self._crc8(self._crc_buffer)
+        _COMMAND_VALUE.pack_into(self._buffer, 0, cmd, value & 0xFFFF)
+        self._buffer[4] = self._crc8_word(self._buffer[2], self._buffer[3])
+        self._wait_ready()
         with self.i2c_device as i2c:
             i2c.write(self._buffer, end=5)
-        time.sleep(delay_ms * 1000)
-
-    def _original_read_reply(self, buff, num):
-        with self.i2c_device as i2c:
-            i2c.readinto(buff, end=num)
-        self._check_buffer_crc(self._buffer[0:num])
-
-    @staticmethod
-    def _crc8(buffer: bytearray) -> int:
-        crc = 0xFF
-        for byte in buffer:
-            crc ^= byte
-            for _ in range(8):
-                if crc & 0x80:
-                    crc = (crc << 1) ^ 0x31
-                else:
-                    crc = crc << 1
-        return crc & 0xFF  # return the bottom 8 bits
+        if delay_ms:
+            time.sleep(delay_ms / 1000.0)
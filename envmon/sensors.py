@@ -1,6 +1,6 @@
 import logging
-from logging import Logger
 import time
+import struct
 from dataclasses import dataclass
 from adafruit_bus_device.i2c_device import I2CDevice
 
@@ -10,9 +10,21 @@ try:
 except ImportError:
     pass
 
-logger: Logger = logging.getLogger(__name__)
 
-SCD40_ADDR = 0x62
+def _crc8_byte(crc: int) -> int:
+    """ CRC-8 (polynomial 0x31) of one byte, used to build the lookup table """
+    for _ in range(8):
+        if crc & 0x80:
+            crc = (crc << 1) ^ 0x31
+        else:
+            crc = crc << 1
+    return crc & 0xFF  # return the bottom 8 bits
+
+
+_CRC8_TABLE = bytes(_crc8_byte(i) for i in range(256))
+
+# 16 bit big endian word, the command size of Sensirion sensors
+_WORD = struct.Struct(">H")
 
 
 @dataclass
@@ -35,7 +47,13 @@ class Sensor():
         self._sensor_data = sensor_data
         self._interval = 5.0  # 5 seconds unless otherwise specified
         self._buffer = None
-        self._connected = self.open_connection()
+        self._ready_at = 0.0  # monotonic time a deferred command finishes
+        # Register address and reply buffers reused by every _read_register call,
+        # the reply buffer grows on first use so sensors without registers stay empty
+        self._register_cmd = bytearray(1)
+        self._register_reply = memoryview(bytearray())
+        # Checked before every transfer, so a plain attribute rather than a property
+        self.connected: Optional[bool] = self.open_connection()
         if self.logger is None:
             self.logger = logging.getLogger("envmon.sensor")
 
@@ -54,10 +72,6 @@ class Sensor():
             self.logger.debug("Connected")
             return True
 
-    @property
-    def connected(self) -> Optional[bool]:
-        return self._connected
-
     @property
     def read_interval(self) -> float:
         return self._interval
@@ -72,26 +86,40 @@ class Sensor():
     def read(self):
         raise NotImplementedError("Subclasses of Sensor impl read function")
 
-    def _read_raw(self, buffer: Optional[bytearray] = None, length=1) -> None:
-        if self._buffer is None:
-            raise NotImplementedError("Need to give this a bytearray buffer")
-        if self._connected and self.i2c_device:
+    def _read_raw(self, buffer: Optional[bytearray] = None, length: Optional[int] = None) -> bool:
+        """
+        Read into buffer, or the sensor's own buffer, filling it unless length is given
+        Returns False if nothing was read and the buffer still holds the previous contents
+        """
+        if buffer is None:
+            if self._buffer is None:
+                raise NotImplementedError("Need to give this a bytearray buffer")
+            buffer = self._buffer
+        if length is None:
+            length = len(buffer)
+        self._wait_ready()
+        if self.connected and self.i2c_device:
             with self.i2c_device as device:
                 try:
-                    if buffer is None:
-                        device.readinto(self._buffer, end=length)
-                    else:
-                        device.readinto(buffer, end=length)
+                    device.readinto(buffer, end=length)
+                    return True
 
                 except OSError as err:
                     self.logger.error("Unable to read from sensor")
                     self.logger.error(err)
-                    self._connected = False
+                    self.connected = False
         else:
-            self.open_connection()
+            self.connected = self.open_connection()
+        return False
 
     def _send_cmd(self, cmd: Optional[Union[bytearray, bytes]] = None, **kwargs) -> None:
-        if self._connected and self.i2c_device:
+        """
+        Write a command and wait delay_ms for the sensor to process it
+        With defer=True the wait is left to the next access to the sensor,
+        so the caller can do other work, like setting up other sensors, meanwhile
+        """
+        self._wait_ready()
+        if self.connected and self.i2c_device:
             with self.i2c_device as device:
                 if cmd is None:
                     if self._send_buffer is None:
@@ -102,61 +130,72 @@ class Sensor():
 
                 cmd = self.convert_16(cmd)
                 device.write(cmd)
-        time.sleep(kwargs.get("delay_ms", 0)/1000.0)
+            # Only wait for the sensor to process a command that was sent
+            delay_ms = kwargs.get("delay_ms", 0)
+            if kwargs.get("defer", False):
+                self._ready_at = time.monotonic() + delay_ms / 1000.0
+            elif delay_ms:
+                time.sleep(delay_ms / 1000.0)
+
+    def _wait_ready(self) -> None:
+        """ Block until a command sent with defer=True has finished """
+        if self._ready_at:
+            remaining = self._ready_at - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+            self._ready_at = 0.0
 
     @staticmethod
-    def convert_16(val) -> Union[bytearray, bytes]:
-        if isinstance(val, bytearray) or isinstance(val, bytes):
+    def convert_16(val, _pack=_WORD.pack) -> Union[bytearray, bytes]:
+        if isinstance(val, (bytearray, bytes)):
             return val
-        ret: bytearray = bytearray(2)
-        if not isinstance(val, int):
-            val = int(val)
-        ret[0] = (val >> 8) & 0xFF
-        ret[1] = val & 0xFF
-        return ret
+        return _pack(int(val) & 0xFFFF)
 
     def _read_reply(
             self, delay_ms: int = 30,
             length: int = 1,
             **kwargs
-    ):
-        ''' Send command and read back whats recieved '''
-        word_len = 2
+    ) -> bool:
+        ''' Send command and read back whats recieved, False if nothing was '''
         cmd = kwargs.get("cmd")
         self._send_cmd(cmd)
 
-        time.sleep(round(delay_ms * 0.001, 3))
-
-        # reply_buffer = bytearray(length * (word_len + 1))
-        self._read_raw(length=length)
-        data_buffer = []
-        # if not kwargs.get("raw", False):
-        #     self.logger.debug("me")
-        #     for i in range(0, length * (word_len + 1), 3):
-        #         data_buffer.append(struct.unpack_from(
-        #             ">H", self._buffer[i:i+2])[0])
-        # return data_buffer
-
-    def _read_register(self, register: int, length: int) -> bytearray:
-        register_value = bytearray(length)
-        self._send_cmd(bytes([register & 0xFF]))
-        self._read_raw(register_value, length=24)
+        if delay_ms:
+            time.sleep(delay_ms / 1000.0)
+
+        return self._read_raw(length=length)
+
+    def _read_register(self, register: int, length: int) -> memoryview:
+        """
+        Write the register address and read back with a repeated start
+        The reply is a view of a buffer reused by the next read, copy it to keep it
+        """
+        if length > len(self._register_reply):
+            self._register_reply = memoryview(bytearray(length))
+        register_value = self._register_reply[:length]
+        self._register_cmd[0] = register & 0xFF
+        self._wait_ready()
+        if self.connected and self.i2c_device:
+            with self.i2c_device as device:
+                try:
+                    device.write_then_readinto(self._register_cmd, register_value)
+                except OSError as err:
+                    self.logger.error("Unable to read from sensor")
+                    self.logger.error(err)
+                    self.connected = False
+                    register_value[:] = bytes(length)
+        else:
+            self.connected = self.open_connection()
+            register_value[:] = bytes(length)  # don't hand back the previous reply
         return register_value
 
     def _read_byte(self, register):
         return self._read_register(register, 1)[0]
 
     @staticmethod
-    def _crc8(buffer: bytearray) -> int:
-        crc = 0xFF
-        for byte in buffer:
-            crc ^= byte
-            for _ in range(8):
-                if crc & 0x80:
-                    crc = (crc << 1) ^ 0x31
-                else:
-                    crc = crc << 1
-        return crc & 0xFF  # return the bottom 8 bits
+    def _crc8_word(msb: int, lsb: int, _table: bytes = _CRC8_TABLE) -> int:
+        """ CRC of one 2 byte data word, the unit Sensirion sensors checksum """
+        return _table[_table[0xFF ^ msb] ^ lsb]
 
 
 
@@ -1,43 +1,59 @@
 import time
+import heapq
 from typing import Callable
 
 """
 Basic timer class
 Similar to arduino's "blink without delay"
-Calculate delta between current time and the previous event trigger
+Each event is due one interval after it last triggered
 """
 
 class Event():
+    __slots__ = ("_callback", "_interval", "_deadline")
+
     def __init__(self, callback: Callable, interval: float):
         self._callback = callback  # the function to call when event triggers
-        self._interval = interval  # time between event triggers
-        self._prev = 0.0
+        self._interval = int(interval * 1_000_000_000)  # nanoseconds between event triggers
+        self._deadline = 0  # time after which the event next triggers
+
+    def __lt__(self, other: "Event") -> bool:
+        return self._deadline < other._deadline
+
+    def reschedule(self, now):
+        self._deadline = now + self._interval
 
-    def update(self, now):
-        if now - self._prev > self._interval:
-            self._callback()
-            self._prev = now
+    def fire(self):
+        self._callback()
 
 
 class Timer():
+    __slots__ = ("_now", "_events")
+
     def __init__(self) -> None:
-        self._now = time.perf_counter()  # current time
-        self._prev = 0.0
-        self._events: list[Event] = []  # array of event objects
+        self._now = time.monotonic_ns()  # current time in nanoseconds
+        self._events: list[Event] = []  # heap of event objects, next due first
 
     @property
     def now(self) -> float:
-        return self._now
+        """ Time of the last run in seconds """
+        return self._now / 1_000_000_000
 
-    def run(self) -> None:
-        """ 
+    def run(self, _clock=time.monotonic_ns) -> None:
+        """
         Update the timer, check events for trigger
         Must be called every loop
+        Only events that are due are visited, the rest stay in the heap
         """
-        self._now = time.perf_counter()
-        for e in self._events:
-            e.update(self._now)
+        now = self._now = _clock()
+        events = self._events
+        while events and events[0]._deadline < now:
+            event = events[0]
+            # Reschedule before calling back, so a callback that raises
+            # doesn't stay due and get retried on every run
+            event.reschedule(now)
+            heapq.heapreplace(events, event)
+            event.fire()
 
     def add_event(self, callback: Callable, interval: float):
-        """ Add an event object to the list """
-        self._events.append(Event(callback, interval))
+        """ Add an event object to the heap """
+        heapq.heappush(self._events, Event(callback, interval))